@@ -4,7 +4,8 @@ Core decoder for FOLD - converts video back to data
 
 import cv2
 import numpy as np
-from typing import Union
+from typing import Generator, Union
+import itertools
 import os
 import time
 
@@ -37,27 +38,32 @@ def retrieve(video_path: str) -> bytes:
         file_size = os.path.getsize(video_path)
         logger.info(f"Input video size: {file_size} bytes")
         
-        # Read video frames
+        # Read video frames lazily; they are decoded as they arrive
         logger.info("Reading video frames...")
         frames = _read_video_frames(video_path)
-        logger.info(f"Read {len(frames)} frames")
         
-        if not frames:
-            raise FileCorruptionError("No frames found in video")
-        
-        # Get video dimensions
-        height, width = frames[0].shape[:2]
-        
-        # Create fractal decoder
-        decoder = FractalEncoder(width, height)
-        
-        # Decode frames to data
-        logger.info("Decoding fractal frames to data...")
         try:
-            data = decoder.decode_pixels_to_data(frames)
-            logger.info(f"Recovered data size: {len(data)} bytes")
-        except ValueError as e:
-            raise FileCorruptionError(f"Data corruption detected: {str(e)}")
+            first_frame = next(frames, None)
+            if first_frame is None:
+                raise FileCorruptionError("No frames found in video")
+            
+            # Get video dimensions
+            height, width = first_frame.shape[:2]
+            logger.info(f"Frame size: {width}x{height}")
+            
+            # Create fractal decoder
+            decoder = FractalEncoder(width, height)
+            
+            # Decode frames to data
+            logger.info("Decoding fractal frames to data...")
+            try:
+                data = decoder.decode_pixels_to_data(itertools.chain([first_frame], frames))
+                logger.info(f"Recovered data size: {len(data)} bytes")
+            except ValueError as e:
+                raise FileCorruptionError(f"Data corruption detected: {str(e)}")
+        finally:
+            # Release the capture even if decoding stopped early
+            frames.close()
         
         # Log performance
         exec_time = time.time() - start_time
@@ -71,37 +77,47 @@ def retrieve(video_path: str) -> bytes:
         logger.error(f"Decoding failed: {str(e)}")
         raise DecodingError(f"Failed to decode video: {str(e)}") from e
 
-def _read_video_frames(video_path: str) -> list:
-    """Read all frames from video file"""
+def _read_video_frames(video_path: str) -> Generator[np.ndarray, None, None]:
+    """
+    Yield frames from video file one at a time
+    
+    Every frame is decoded into the same buffer, so each one is only
+    valid until the next is requested.
+    """
     try:
         cap = cv2.VideoCapture(video_path)
         
-        if not cap.isOpened():
-            raise DecodingError("Failed to open video file")
-        
-        frames = []
-        frame_count = 0
-        
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-                
-            # Convert BGR to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            frames.append(frame_rgb)
-            frame_count += 1
+        try:
+            if not cap.isOpened():
+                raise DecodingError("Failed to open video file")
             
-            # Progress logging for large videos
-            if frame_count % 100 == 0:
-                logger.debug(f"Read {frame_count} frames...")
-        
-        cap.release()
-        
-        if not frames:
-            raise FileCorruptionError("Video contains no decodable frames")
+            frame_count = 0
+            frame = None
+            
+            while True:
+                # Decode into the previous frame's buffer, not a new array
+                ret, frame = cap.read(frame)
+                if not ret:
+                    break
+                    
+                # Frames are decoded through flat views; a strided frame
+                # would make every reshape copy it. Checked once, and
+                # only when assertions are enabled.
+                if frame_count == 0:
+                    assert frame.flags.c_contiguous, "VideoCapture returned a non-contiguous frame"
+                
+                # Keep OpenCV's BGR order; it matches what the encoder wrote
+                yield frame
+                frame_count += 1
+                
+                # Progress logging for large videos
+                if frame_count % 100 == 0:
+                    logger.debug(f"Read {frame_count} frames...")
             
-        return frames
+            if frame_count == 0:
+                raise FileCorruptionError("Video contains no decodable frames")
+        finally:
+            cap.release()
         
     except Exception as e:
         raise DecodingError(f"Failed to read video frames: {str(e)}") from e
\ No newline at end of file
@@ -2,25 +2,34 @@
 Core encoder for FOLD - converts data to video
 """
 
+import av
 import cv2
 import numpy as np
-from typing import Union, Optional
+from typing import Iterable, Tuple, Union, Optional
+import math
 import os
 import time
 from tqdm import tqdm
 
-from .fractal import FractalEncoder, _default_encoder
+from .fractal import FractalEncoder, HEADER_SIZE, _default_encoder
 from ..utils.validation import validate_input_data, validate_output_path
 from ..utils.logging import setup_logger, log_performance
 from ..exceptions import EncodingError
 
 logger = setup_logger("fold.encoder")
 
+DEFAULT_WIDTH = 1920
+DEFAULT_HEIGHT = 1080
+# Auto-sized frames are square with sides rounded up to this multiple
+FRAME_ALIGN = 16
+
 def store(data: Union[str, bytes, bytearray], 
           output_path: Optional[str] = None,
           fps: int = 30,
-          width: int = 1920,
-          height: int = 1080) -> str:
+          width: Optional[int] = None,
+          height: Optional[int] = None,
+          bits_per_channel: int = 8,
+          workers: int = 1) -> str:
     """
     Convert data to video file using fractal encoding
     
@@ -28,8 +37,10 @@ def store(data: Union[str, bytes, bytearray],
         data: Input data (string, bytes, or bytearray)
         output_path: Output video file path (optional)
         fps: Frames per second
-        width: Video width
-        height: Video height
+        width: Video width (optional, sized to the data when omitted)
+        height: Video height (optional, sized to the data when omitted)
+        bits_per_channel: Data bits stored per colour channel (8 or 1)
+        workers: Number of processes building frames in parallel
         
     Returns:
         str: Path to created video file
@@ -50,17 +61,26 @@ def store(data: Union[str, bytes, bytearray],
         
         output_path = validate_output_path(output_path)
         
+        # Pick frame dimensions
+        if width is None and height is None:
+            width, height = _auto_frame_size(len(byte_data), bits_per_channel)
+        else:
+            width = width or DEFAULT_WIDTH
+            height = height or DEFAULT_HEIGHT
+        logger.info(f"Frame size: {width}x{height}")
+        
         # Create fractal encoder
-        encoder = FractalEncoder(width, height)
+        encoder = FractalEncoder(width, height, bits_per_channel)
         
-        # Encode data to frames
+        # Encode data to frames lazily; each frame is written and dropped
         logger.info("Encoding data to fractal frames...")
-        frames = list(encoder.encode_data_to_pixels(byte_data))
-        logger.info(f"Generated {len(frames)} frames")
+        frames = encoder.encode_data_to_pixels(byte_data, workers=workers)
+        frame_count = encoder.frame_count(len(byte_data))
+        logger.info(f"Generating {frame_count} frames")
         
         # Write video file
         logger.info(f"Writing video to {output_path}")
-        _write_video(frames, output_path, fps, width, height)
+        _write_video(frames, output_path, fps, width, height, total=frame_count)
         
         # Log performance
         exec_time = time.time() - start_time
@@ -73,6 +93,20 @@ def store(data: Union[str, bytes, bytearray],
         logger.error(f"Encoding failed: {str(e)}")
         raise EncodingError(f"Failed to encode data: {str(e)}") from e
 
+def _auto_frame_size(data_length: int, bits_per_channel: int) -> Tuple[int, int]:
+    """Pick frame dimensions for a payload of data_length bytes"""
+    payload_bits = (HEADER_SIZE + data_length) * 8
+    
+    # Large payloads fill full-size frames
+    if payload_bits >= DEFAULT_WIDTH * DEFAULT_HEIGHT * 3 * bits_per_channel:
+        return DEFAULT_WIDTH, DEFAULT_HEIGHT
+    
+    # Small payloads get one square frame just big enough to hold them,
+    # instead of a mostly-padding full-size frame
+    pixels = math.ceil(payload_bits / (3 * bits_per_channel))
+    side = math.ceil(math.sqrt(pixels) / FRAME_ALIGN) * FRAME_ALIGN
+    return side, side
+
 def _generate_output_path(data: bytes) -> str:
     """Generate default output path based on data"""
     import hashlib
@@ -85,42 +119,52 @@ def _generate_output_path(data: bytes) -> str:
     filename = f"fold_{data_hash}_{timestamp}.mp4"
     return os.path.join(os.getcwd(), filename)
 
-def _write_video(frames: list, output_path: str, fps: int, width: int, height: int):
-    """Write frames to video file using lossless codec"""
+def _to_video_frame(frame: np.ndarray) -> av.VideoFrame:
+    """Copy a BGR frame straight into a bgr0 AVFrame"""
+    height, width = frame.shape[:2]
+    video_frame = av.VideoFrame(width, height, 'bgr0')
+    
+    # Fill the encoder's native layout in one pass, rather than wrapping
+    # as bgr24 and letting swscale build a second bgr0 frame
+    plane = video_frame.planes[0]
+    rows = np.frombuffer(plane, dtype=np.uint8).reshape(height, plane.line_size)
+    cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=rows[:, :width * 4].reshape(height, width, 4))
+    
+    return video_frame
+
+def _write_video(frames: Iterable[np.ndarray], output_path: str, fps: int, width: int, height: int,
+                 total: Optional[int] = None):
+    """Write frames to video file using lossless codec, consuming them once"""
     try:
-        # Use AVI container with uncompressed codec for lossless
-        # OpenCV works best with AVI for raw/lossless video
-        avi_path = output_path.replace('.mp4', '.avi') if output_path.endswith('.mp4') else output_path
-        if not avi_path.endswith('.avi'):
-            avi_path = avi_path + '.avi'
-        
-        # Use uncompressed RGBA codec - truly lossless
-        fourcc = cv2.VideoWriter_fourcc(*'RGBA')
-        video_writer = cv2.VideoWriter(avi_path, fourcc, fps, (width, height))
-        
-        if not video_writer.isOpened():
-            raise EncodingError("Failed to initialize video writer")
-        
-        # Write frames with progress bar
-        for frame in tqdm(frames, desc="Writing frames", unit="frame"):
-            # Convert RGB to BGR for OpenCV
-            frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            video_writer.write(frame_bgr)
-        
-        video_writer.release()
+        # Container comes from the extension; default to AVI without one
+        container_format = None if os.path.splitext(output_path)[1] else 'avi'
+        container = av.open(output_path, mode='w', format=container_format)
+        
+        try:
+            # FFV1 is lossless for every 8-bit channel value, which the
+            # dense bits_per_channel=8 layout depends on. Level 3 splits
+            # each frame into slices that encode on separate threads.
+            stream = container.add_stream('ffv1', rate=fps, options={'level': '3'})
+            stream.width = width
+            stream.height = height
+            # bgr0 is FFV1's packed 8-bit RGB layout
+            stream.pix_fmt = 'bgr0'
+            stream.codec_context.thread_type = 'SLICE'
+            
+            # Write frames with progress bar
+            for frame in tqdm(frames, total=total, desc="Writing frames", unit="frame"):
+                container.mux(stream.encode(_to_video_frame(frame)))
+            
+            # Flush frames still buffered in the encoder
+            container.mux(stream.encode())
+        finally:
+            container.close()
         
         # Verify file was created
-        if not os.path.exists(avi_path):
+        if not os.path.exists(output_path):
             raise EncodingError("Video file was not created")
         
-        # Rename to .mp4 if requested
-        if output_path.endswith('.mp4') and avi_path != output_path:
-            import shutil
-            shutil.move(avi_path, output_path)
-        else:
-            output_path = avi_path
-        
         logger.info(f"Video file size: {os.path.getsize(output_path)} bytes")
         
     except Exception as e:
-        raise EncodingError(f"Failed to write video: {str(e)}") from e
\ No newline at end of file
+        raise EncodingError(f"Failed to write video: {str(e)}") from e
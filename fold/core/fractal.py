@@ -3,161 +3,300 @@ Fractal mathematics engine for FOLD
 """
 
 import numpy as np
-from typing import Tuple, Generator
-import zlib
+from typing import Tuple, Generator, Iterable, Optional, Union
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import math
+import multiprocessing
+import struct
+
+try:
+    # ISA-L computes the same CRC-32 as zlib using carry-less multiply
+    # (PCLMULQDQ) folding, several times faster on large payloads
+    from isal.isal_zlib import crc32
+except ImportError:
+    from zlib import crc32
+
+from .kernels import HAS_CUPY, TILE_SIZE, expand_bits, threshold_and_pack
+
+MAGIC = b"FOLD"
+# MAGIC + LENGTH + CHECKSUM, big-endian
+HEADER = struct.Struct('>4sII')
+HEADER_SIZE = HEADER.size
 
 class FractalEncoder:
     """Fractal-based data encoding engine"""
     
-    def __init__(self, width: int = 1920, height: int = 1080):
+    def __init__(self, width: int = 1920, height: int = 1080, bits_per_channel: int = 8,
+                 use_gpu: bool = False):
+        """
+        Args:
+            width: Frame width
+            height: Frame height
+            bits_per_channel: 8 stores a full data byte in every channel and
+                needs a lossless codec; 1 stores one bit per channel as 0/255,
+                which survives mild compression at 8x the frame count
+            use_gpu: Experimental, not yet run on real hardware. Run the
+                1-bit expand and threshold kernels on a CUDA GPU through
+                CuPy; 8-bit frames are plain copies either way
+        """
+        if bits_per_channel not in (1, 8):
+            raise ValueError("bits_per_channel must be 1 or 8")
+        if use_gpu and not HAS_CUPY:
+            raise ValueError("use_gpu requires cupy")
+        
         self.width = width
         self.height = height
+        self.bits_per_channel = bits_per_channel
+        self.use_gpu = use_gpu
         self.pixels_per_frame = width * height
+        self.bytes_per_frame = self.pixels_per_frame * 3 * bits_per_channel // 8
+        if self.bytes_per_frame == 0:
+            raise ValueError("Frame too small to hold a byte")
+        # Decoding tells 8-bit from 1-bit videos by the magic at the start
+        # of the first frame, so a dense frame has to hold all of it
+        if bits_per_channel == 8 and self.bytes_per_frame < len(MAGIC):
+            raise ValueError("Frame too small to hold the header magic")
+        # Reused for every encoded frame
+        self._frame_buf = np.empty((height, width, 3), dtype=np.uint8)
+        # Reused for thresholded bits of every decoded 1-bit frame
+        self._threshold_buf = (np.empty(min(self.bytes_per_frame * 8, TILE_SIZE), dtype=np.uint8)
+                               if bits_per_channel == 1 else None)
+        # Per-pixel fractal coordinates, built on first use
+        self._transform_grid = None
         
-    def encode_data_to_pixels(self, data: bytes) -> Generator[np.ndarray, None, None]:
+    def frame_count(self, data_length: int) -> int:
+        """Number of frames encode_data_to_pixels yields for data_length bytes"""
+        return math.ceil((HEADER_SIZE + data_length) / self.bytes_per_frame)
+    
+    def encode_data_to_pixels(self, data: bytes, workers: int = 1) -> Generator[np.ndarray, None, None]:
         """
         Encode binary data into fractal pixel patterns
         
         Args:
             data: Binary data to encode
+            workers: Number of processes building frames; 1 builds them
+                in this process. Worker processes always run on the CPU and
+                are started fresh (forkserver, or spawn where unavailable),
+                never forked, so scripts using workers > 1 need an
+                if __name__ == "__main__" guard.
             
         Yields:
-            numpy arrays representing RGB frames
+            numpy arrays representing BGR frames (OpenCV channel order).
+            With workers=1 every frame is the same reused buffer, valid
+            until the next one is requested; copy frames to keep them.
         """
-        # Convert data to bit string with header
-        bit_string = self._prepare_bit_string(data)
+        # Convert data to byte array with header
+        payload = self._prepare_bit_string(data)
         
         # Process in chunks that fit in frame
-        bits_per_frame = self.pixels_per_frame * 3  # RGB channels
+        offsets = range(0, len(payload), self.bytes_per_frame)
         
-        for i in range(0, len(bit_string), bits_per_frame):
-            chunk = bit_string[i:i + bits_per_frame]
-            frame = self._bits_to_fractal_frame(chunk)
-            yield frame
+        if workers <= 1:
+            for i in offsets:
+                chunk = payload[i:i + self.bytes_per_frame]
+                frame = self._bits_to_fractal_frame(chunk)
+                yield frame
+            return
+        
+        # Frames are independent, so workers build them in parallel. Only
+        # a bounded window is in flight (unlike executor.map, which
+        # submits everything up front) and results come back in order.
+        # Forking after numba has started its thread pool can leave the
+        # parent hung at exit, so workers never fork from this process
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        mp_context = multiprocessing.get_context(start_method)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            pending = deque()
+            for i in offsets:
+                chunk = payload[i:i + self.bytes_per_frame]
+                pending.append(executor.submit(
+                    _encode_chunk, self.width, self.height, self.bits_per_channel, chunk))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
     
-    def decode_pixels_to_data(self, frames: list) -> bytes:
+    def decode_pixels_to_data(self, frames: Iterable[np.ndarray]) -> bytes:
         """
         Decode fractal pixel patterns back to binary data
         
+        Frames are consumed one at a time and iteration stops as soon as
+        the payload length announced by the header has been read. Each
+        frame is fully read before the next is requested, so sources may
+        reuse a single buffer. The channel density is detected from the
+        first frame, so videos written with either bits_per_channel
+        setting decode correctly.
+        
         Args:
-            frames: List of frame arrays
+            frames: Iterable of frame arrays
             
         Returns:
             Decoded binary data
         """
-        bit_string = ""
+        frames = iter(frames)
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("Incomplete header")
+        
+        bits_per_channel = self._detect_bits_per_channel(first)
+        if bits_per_channel == 1 and self._is_rgb_ordered(first):
+            # Written before frames switched to BGR order: every pixel's
+            # channel triple is reversed, so swap it back before decoding
+            decoder = FractalEncoder(self.width, self.height, 1, self.use_gpu)
+            return decoder.decode_pixels_to_data(
+                np.ascontiguousarray(frame[..., ::-1]) for frame in itertools.chain([first], frames))
+        if bits_per_channel != self.bits_per_channel:
+            decoder = FractalEncoder(self.width, self.height, bits_per_channel, self.use_gpu)
+            return decoder.decode_pixels_to_data(itertools.chain([first], frames))
+        
+        # The header only spans several frames when frames are tiny
+        head = self._fractal_frame_to_bits(first)
+        while len(head) < HEADER_SIZE:
+            # Frame sources may reuse one buffer, so keep a copy
+            head = head.copy()
+            frame = next(frames, None)
+            if frame is None:
+                break
+            head = np.concatenate([head, self._fractal_frame_to_bits(frame)])
         
-        for frame in frames:
-            chunk_bits = self._fractal_frame_to_bits(frame)
-            bit_string += chunk_bits
+        length, _ = self._parse_header(head)
+        total = HEADER_SIZE + length
         
-        return self._parse_bit_string(bit_string)
+        payload = np.empty(total, dtype=np.uint8)
+        filled = min(len(head), total)
+        payload[:filled] = head[:filled]
+        
+        while filled < total:
+            frame = next(frames, None)
+            if frame is None:
+                break
+            if total - filled >= self.bytes_per_frame:
+                # Full frames are thresholded straight into the payload
+                self._fractal_frame_to_bits(frame, out=payload[filled:filled + self.bytes_per_frame])
+                filled += self.bytes_per_frame
+            else:
+                chunk = self._fractal_frame_to_bits(frame)
+                payload[filled:] = chunk[:total - filled]
+                filled = total
+        
+        return self._parse_bit_string(payload[:filled])
+    
+    def _detect_bits_per_channel(self, frame: np.ndarray) -> int:
+        """Return 8 if the frame starts with a dense header, else 1"""
+        # A 1-bit frame only holds 0/255 channel values, so it can never
+        # start with the raw magic bytes
+        if frame.reshape(-1)[:len(MAGIC)].tobytes() == MAGIC:
+            return 8
+        return 1
+    
+    def _is_rgb_ordered(self, frame: np.ndarray) -> bool:
+        """Return True if a 1-bit frame only shows the magic with each pixel's channels reversed"""
+        # The magic spans the first 32 channel values, i.e. 11 pixels
+        pixels = frame.reshape(-1, 3)[:11]
+        if len(pixels) < 11:
+            return False
+        if np.packbits(pixels.reshape(-1)[:32] >= 128).tobytes() == MAGIC:
+            return False
+        return np.packbits(pixels[:, ::-1].reshape(-1)[:32] >= 128).tobytes() == MAGIC
     
-    def _prepare_bit_string(self, data: bytes) -> str:
+    def _prepare_bit_string(self, data: bytes) -> np.ndarray:
         """Prepare data with header containing metadata"""
         # Calculate CRC32 checksum
-        checksum = zlib.crc32(data)
+        checksum = crc32(data)
         
         # Create header: MAGIC + LENGTH + CHECKSUM + DATA
-        magic = "FOLD"
-        length = len(data)
+        payload = HEADER.pack(MAGIC, len(data), checksum) + data
         
-        # Convert to binary strings
-        magic_bits = ''.join(format(ord(c), '08b') for c in magic)
-        length_bits = format(length, '032b')
-        checksum_bits = format(checksum, '032b')
-        data_bits = ''.join(format(b, '08b') for b in data)
-        
-        return magic_bits + length_bits + checksum_bits + data_bits
+        return np.frombuffer(payload, dtype=np.uint8)
     
-    def _parse_bit_string(self, bit_string: str) -> bytes:
-        """Parse bit string back to data, validating checksum"""
-        # Parse header
-        magic_bits = bit_string[:32]  # 4 bytes
-        length_bits = bit_string[32:64]  # 4 bytes
-        checksum_bits = bit_string[64:96]  # 4 bytes
-        data_bits = bit_string[96:]
+    def _parse_header(self, payload: np.ndarray) -> Tuple[int, int]:
+        """Validate the header and return (length, checksum)"""
+        if len(payload) < HEADER_SIZE:
+            raise ValueError("Incomplete header")
+        
+        magic, length, checksum = HEADER.unpack(payload[:HEADER_SIZE].tobytes())
         
         # Validate magic
-        magic = ''.join(chr(int(magic_bits[i:i+8], 2)) for i in range(0, 32, 8))
-        if magic != "FOLD":
+        if magic != MAGIC:
             raise ValueError("Invalid FOLD file format")
         
-        # Get length and validate
-        length = int(length_bits, 2)
-        expected_data_bits = length * 8
+        return length, checksum
+    
+    def _parse_bit_string(self, payload: np.ndarray) -> bytes:
+        """Parse packed payload back to data, validating checksum"""
+        length, expected_checksum = self._parse_header(payload)
+        data = payload[HEADER_SIZE:]
         
-        if len(data_bits) < expected_data_bits:
+        # Validate length
+        if len(data) < length:
             raise ValueError("Incomplete data")
         
         # Extract actual data
-        actual_data_bits = data_bits[:expected_data_bits]
-        data_bytes = bytes(int(actual_data_bits[i:i+8], 2) for i in range(0, len(actual_data_bits), 8))
+        data_bytes = data[:length].tobytes()
         
         # Validate checksum
-        calculated_checksum = zlib.crc32(data_bytes)
-        expected_checksum = int(checksum_bits, 2)
+        calculated_checksum = crc32(data_bytes)
         
         if calculated_checksum != expected_checksum:
             raise ValueError("Data corruption detected - checksum mismatch")
         
         return data_bytes
     
-    def _bits_to_fractal_frame(self, bit_string: str) -> np.ndarray:
-        """Convert bit string to frame (systematic bit mapping)"""
-        # Pad bit string to fill frame
-        total_bits = self.pixels_per_frame * 3
-        padded_bits = bit_string.ljust(total_bits, '0')
-        
-        # Convert to pixel values (systematic mapping)
-        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        
-        bit_index = 0
-        for y in range(self.height):
-            for x in range(self.width):
-                # Take 3 consecutive bits for R,G,B
-                if bit_index + 2 < len(padded_bits):
-                    r_bit = padded_bits[bit_index]
-                    g_bit = padded_bits[bit_index + 1]
-                    b_bit = padded_bits[bit_index + 2]
-                    
-                    r = 255 if r_bit == '1' else 0
-                    g = 255 if g_bit == '1' else 0
-                    b = 255 if b_bit == '1' else 0
-                    
-                    frame[y, x] = [r, g, b]
-                    bit_index += 3
-                else:
-                    # Fill remaining with black
-                    frame[y, x] = [0, 0, 0]
-        
-        return frame
+    def _bits_to_fractal_frame(self, chunk: np.ndarray) -> np.ndarray:
+        """Convert payload bytes to frame (systematic bit mapping)"""
+        # Consecutive values fill the channels of each pixel, row-major.
+        # Frames are produced directly in the BGR order OpenCV writes and
+        # reads, so no colour conversion is needed on either side.
+        values = self._frame_buf.reshape(-1)
+        
+        if self.bits_per_channel == 8:
+            # One payload byte per channel
+            n = len(chunk)
+            values[:n] = chunk
+        else:
+            # One payload bit per channel, stored as 0/255
+            n = len(chunk) * 8
+            expand_bits(chunk, values[:n], self.use_gpu)
+        
+        # Pad to fill frame; remaining pixels stay black
+        values[n:] = 0
+        
+        return self._frame_buf
     
-    def _fractal_frame_to_bits(self, frame: np.ndarray) -> str:
-        """Convert frame back to bit string (systematic bit mapping)"""
-        bit_string = ""
-        
-        for y in range(self.height):
-            for x in range(self.width):
-                # Extract RGB values and convert to bits
-                r, g, b = frame[y, x]
-                # Use consistent threshold for bit recovery
-                r_bit = '1' if r >= 128 else '0'
-                g_bit = '1' if g >= 128 else '0'
-                b_bit = '1' if b >= 128 else '0'
-                
-                bit_string += r_bit + g_bit + b_bit
-        
-        return bit_string
+    def _fractal_frame_to_bits(self, frame: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Convert frame back to payload bytes (systematic bit mapping)
+        
+        The frame is read in whatever channel order it arrives in; no
+        conversion runs before the threshold. Bytes are written into out
+        (bytes_per_frame long) when given.
+        """
+        values = frame.reshape(-1)
+        
+        if self.bits_per_channel == 8:
+            if out is None:
+                return values[:self.bytes_per_frame]
+            out[:] = values[:self.bytes_per_frame]
+            return out
+        
+        # Use consistent threshold for bit recovery
+        if out is None:
+            out = np.empty(self.bytes_per_frame, dtype=np.uint8)
+        return threshold_and_pack(values[:self.bytes_per_frame * 8], out, self._threshold_buf, self.use_gpu)
     
-    def _fractal_transform(self, x: int, y: int) -> Tuple[float, float]:
+    def _fractal_transform(self, x: Union[int, np.ndarray],
+                           y: Union[int, np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
         """
         Apply fractal coordinate transformation
         Uses simplified Mandelbrot-like transformation
+        
+        Accepts scalars or broadcastable coordinate arrays.
         """
         # Normalize coordinates
-        nx = x / self.width
-        ny = y / self.height
+        nx = np.asarray(x) / self.width
+        ny = np.asarray(y) / self.height
         
         # Apply non-linear transformation
         # This creates the "fractal" distribution pattern
@@ -166,14 +305,35 @@ class FractalEncoder:
         cy = 0.2
         
         # Mandelbrot-inspired transformation
-        fx = nx + scale * np.sin(2 * np.pi * nx) * np.cos(2 * np.pi * ny) + cx
-        fy = ny + scale * np.cos(2 * np.pi * nx) * np.sin(2 * np.pi * ny) + cy
+        sin_x, cos_x = np.sin(2 * np.pi * nx), np.cos(2 * np.pi * nx)
+        sin_y, cos_y = np.sin(2 * np.pi * ny), np.cos(2 * np.pi * ny)
+        fx = nx + scale * sin_x * cos_y + cx
+        fy = ny + scale * cos_x * sin_y + cy
         
         # Ensure values stay in [0,1] range
         fx = fx % 1.0
         fy = fy % 1.0
         
         return fx, fy
+    
+    def _build_transform_grid(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute fractal coordinates for every pixel, indexed as [y, x]"""
+        # sin/cos only run over one row and one column; broadcasting
+        # expands them to the full (height, width) grid
+        x = np.arange(self.width)[np.newaxis, :]
+        y = np.arange(self.height)[:, np.newaxis]
+        return self._fractal_transform(x, y)
+    
+    @property
+    def transform_grid(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Cached (fx, fy) grids from _build_transform_grid"""
+        if self._transform_grid is None:
+            self._transform_grid = self._build_transform_grid()
+        return self._transform_grid
+
+def _encode_chunk(width: int, height: int, bits_per_channel: int, chunk: np.ndarray) -> np.ndarray:
+    """Build one frame in a worker process"""
+    return FractalEncoder(width, height, bits_per_channel)._bits_to_fractal_frame(chunk)
 
 # Singleton instance for default use
 _default_encoder = FractalEncoder()
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Per-frame bit kernels for FOLD
+"""
+
+import functools
+import importlib.util
+import sys
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Only look for Numba here: importing it costs a noticeable fraction of a
+# second and only the 1-bit kernels use it. The word-at-a-time kernel
+# assumes the first channel value is the lowest byte of each uint64
+HAS_NUMBA = importlib.util.find_spec("numba") is not None and sys.byteorder == "little"
+
+# Only look for CuPy here: it is slow to import and only needed once a
+# GPU kernel actually runs
+HAS_CUPY = importlib.util.find_spec("cupy") is not None
+
+# Channel values thresholded per tile by the fallback path; a multiple of
+# 8 small enough that a tile and its 0/1 scratch stay in L2 for packbits
+TILE_SIZE = 1 << 18
+
+# Row b holds the 8 channel values (0 or 255, MSB first) for byte b,
+# viewed as one native uint64 so a single load/store expands a byte
+_EXPAND_TABLE = (np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1)
+                 * np.uint8(255)).view(np.uint64).ravel()
+
+_LOW_BITS = np.uint64(0x0101010101010101)
+_GATHER = np.uint64(0x8040201008040201)
+
+@functools.lru_cache(maxsize=None)
+def _jit_kernels():
+    """Import numba and compile the 1-bit kernels on first use"""
+    from numba import njit, prange
+
+    # Kernels take uint64 views made by the caller: numba's parallel
+    # lowering does not reliably write through views taken inside them
+
+    @njit(parallel=True, boundscheck=False, cache=True)
+    def threshold_and_pack_jit(words, out):
+        # v >= 128 is the top bit of each channel value, so every output
+        # byte is the 8 top bits of one uint64 word. Multiplying by
+        # _GATHER moves channel k's bit to position 63 - k without
+        # carries, leaving the packed byte in the top 8 bits.
+        for i in prange(words.shape[0]):
+            out[i] = (((words[i] >> np.uint64(7)) & _LOW_BITS) * _GATHER) >> np.uint64(56)
+
+    @njit(parallel=True, boundscheck=False, cache=True)
+    def expand_bits_jit(packed, words, table):
+        # One table load and one 8-byte store per payload byte
+        for i in prange(packed.shape[0]):
+            words[i] = table[packed[i]]
+
+    return threshold_and_pack_jit, expand_bits_jit
+
+def expand_bits(packed: np.ndarray, out: np.ndarray, use_gpu: bool = False) -> np.ndarray:
+    """
+    Expand packed bytes MSB-first into 0/255 channel values
+
+    Args:
+        packed: uint8 payload bytes
+        out: Contiguous uint8 array, len(out) == len(packed) * 8
+        use_gpu: Expand on the GPU with CuPy (experimental)
+
+    Returns:
+        out
+    """
+    if use_gpu:
+        import cupy
+        # Only the packed bytes cross the bus on the way in
+        d_values = cupy.unpackbits(cupy.asarray(packed))
+        d_values *= 255
+        d_values.get(out=out)
+    elif HAS_NUMBA:
+        _, expand_bits_jit = _jit_kernels()
+        expand_bits_jit(packed, out.view(np.uint64), _EXPAND_TABLE)
+    else:
+        np.multiply(np.unpackbits(packed), 255, out=out)
+    return out
+
+def threshold_and_pack(values: np.ndarray, out: np.ndarray,
+                       scratch: Optional[np.ndarray] = None, use_gpu: bool = False) -> np.ndarray:
+    """
+    Threshold channel values at 128 and pack the resulting bits MSB-first
+
+    Args:
+        values: Contiguous uint8 channel values, len(values) == len(out) * 8
+        out: uint8 array receiving the packed bytes
+        scratch: Optional uint8 array of at least min(len(values), TILE_SIZE)
+            elements, reused for thresholded bits when numba is unavailable
+        use_gpu: Threshold and pack on the GPU with CuPy (experimental)
+
+    Returns:
+        out
+    """
+    if use_gpu:
+        import cupy
+        # Only the packed bytes come back to the host
+        cupy.packbits(cupy.asarray(values) >= 128).get(out=out)
+    elif HAS_NUMBA:
+        threshold_and_pack_jit, _ = _jit_kernels()
+        threshold_and_pack_jit(values.view(np.uint64), out)
+    else:
+        # OpenCV's SIMD threshold writes 0/1 into a reusable buffer
+        # instead of allocating a boolean temporary for every frame.
+        # Working tile by tile keeps that buffer in cache for packbits
+        # rather than streaming the whole frame through DRAM twice.
+        if scratch is None:
+            scratch = np.empty(min(len(values), TILE_SIZE), dtype=np.uint8)
+        for start in range(0, len(values), TILE_SIZE):
+            tile = values[start:start + TILE_SIZE]
+            bits = scratch[:len(tile)]
+            cv2.threshold(tile, 127, 1, cv2.THRESH_BINARY, dst=bits)
+            out[start // 8:(start + len(tile)) // 8] = np.packbits(bits)
+    return out
@@ -10,6 +10,10 @@ setup(
     author="FOLD Team",
     packages=find_packages(),
     install_requires=requirements,
+    extras_require={
+        "fast": ["isal>=1.0.0"],
+        "jit": ["numba>=0.56.0"],
+    },
     entry_points={
         "console_scripts": [
             "fold=fold.cli.main:main",